@@ -2,27 +2,24 @@ import argparse
 import logging
 import time
 import math
-from collections import deque
 from typing import Optional, Tuple
 
 import cv2
 import mediapipe as mp
+import numpy as np
 
-try:
-    import serial
-    import serial.tools.list_ports
-    from serial.serialutil import SerialException
-except Exception:
-    serial = None
+from cv_common import (DEFAULT_BAUD, FrameGrabber, SerialClient as BaseSerialClient, TextOverlay,
+                       configure_capture, inference_size, landmarks_to_array, serial, to_inference_rgb)
 
 
 # ---------------------------------------------------------------------------
 # Defaults
 # ---------------------------------------------------------------------------
 DEFAULT_PORT = "/dev/ttyACM0"
-DEFAULT_BAUD = 9600
 DEFAULT_SMOOTH = 6
 DEFAULT_CAMERA = 0
+DEFAULT_INFER_FPS = 15.0
+DEFAULT_INFER_WIDTH = 320
 
 # FaceMesh landmark indices used for mouth
 L_IDX = 61   # left mouth corner
@@ -30,86 +27,40 @@ R_IDX = 291  # right mouth corner
 U_IDX = 13   # upper inner lip
 B_IDX = 14   # lower inner lip
 
+# Label codes produced by SmileDetector; the value is also the serial signal
+LABEL_FROWN = 1
+LABEL_NEUTRAL = 2
+LABEL_SMILE = 3
+LABEL_TEXT = ('', 'frown', 'neutral', 'smile')  # indexed by label code
+# pre-encoded serial lines, so sending does no formatting or encoding
+_CODE_TO_BYTES = {code: f"{code}\n".encode() for code in (LABEL_FROWN, LABEL_NEUTRAL, LABEL_SMILE)}
+
 
 # ---------------------------------------------------------------------------
 # Serial helper
 # ---------------------------------------------------------------------------
-class SerialClient:
-    """Simple serial wrapper that optionally opens a port and sends text lines."""
-
-    def __init__(self, port: Optional[str], baud: int = DEFAULT_BAUD, retries: int = 3, delay: float = 1.0):
-        self.port = port
-        self.baud = baud
-        self.retries = retries
-        self.delay = delay
-        self._ser = None
-        self._available = False
-        if port and serial:
-            self.open()
-        else:
-            logging.info("Serial disabled (no port provided or pyserial missing)")
-
-    def open(self) -> None:
-        candidates = [self.port] if self.port else [p.device for p in serial.tools.list_ports.comports() if ('ACM' in p.device or 'USB' in p.device)]
-        for p in candidates:
-            for attempt in range(1, self.retries + 1):
-                try:
-                    self._ser = serial.Serial(p, self.baud, timeout=1)
-                    time.sleep(0.1)
-                    self._available = True
-                    logging.info("Opened serial port %s at %d", p, self.baud)
-                    return
-                except SerialException as e:
-                    logging.debug("Attempt %d: could not open %s: %s", attempt, p, e)
-                    time.sleep(self.delay)
-        logging.warning("Failed to open serial port; continuing without serial output")
-
-    def send_signal(self, label: str) -> bool:
-        """Map a textual label to an integer signal and send it over serial.
-
-        Mapping:
-          - 'neutral' -> 2
-          - 'smile'   -> 3
-          - 'frown'   -> 1
-        Unknown labels are ignored (no send) and return False.
-        """
-        if not self._available or not self._ser:
-            return False
+class SerialClient(BaseSerialClient):
+    """Serial client (see cv_common.SerialClient) that sends label codes as text lines."""
 
-        mapping = {
-            'neutral': 2,
-            'smile': 3,
-            'frown': 1,
-        }
-        key = (label or '').strip().lower()
-        if key not in mapping:
-            logging.debug("send_signal: unknown label '%s' -> not sending", label)
-            return False
+    def send_signal(self, code: int) -> bool:
+        """Queue a label code (LABEL_FROWN / LABEL_NEUTRAL / LABEL_SMILE) for the serial writer.
 
-        val = mapping[key]
-        try:
-            msg = f"{val}\n".encode()
-            self._ser.write(msg)
-            logging.debug("Serial sent signal: %s -> %d", key, val)
-            return True
-        except Exception as e:
-            logging.warning("Serial write failed: %s", e)
-            try:
-                self._ser.close()
-            except Exception:
-                pass
-            self._available = False
-            self._ser = None
+        The code is sent as-is, so the Arduino receives:
+          - frown   -> 1
+          - neutral -> 2
+          - smile   -> 3
+        Unknown codes are ignored (no send) and return False. Never blocks on I/O.
+        """
+        msg = _CODE_TO_BYTES.get(code)
+        if msg is None:
+            logging.debug("send_signal: unknown label code %r -> not sending", code)
             return False
 
-    def close(self) -> None:
-        if self._ser:
-            try:
-                self._ser.close()
-            except Exception:
-                pass
-            self._ser = None
-            self._available = False
+        if not self.send(msg):
+            return False
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Serial queued signal: %s -> %d", LABEL_TEXT[code], code)
+        return True
 
 
 # ---------------------------------------------------------------------------
@@ -127,36 +78,50 @@ class SmileDetector:
                  smile_thresh: float = 0.32,
                  frown_thresh: float = 0.22,
                  corner_margin: float = 0.015):
-        self.mouth_buf = deque(maxlen=max(1, buf_size))
-        self.corner_buf = deque(maxlen=max(1, buf_size))
+        # fixed-size ring buffers with running sums: O(1) update per frame
+        self.buf_size = max(1, buf_size)
+        self.mouth_buf = np.zeros(self.buf_size, dtype=np.float64)
+        self.corner_buf = np.zeros(self.buf_size, dtype=np.float64)
+        self._i = 0
+        self._n = 0
+        self._mouth_sum = 0.0
+        self._corner_sum = 0.0
         self.smile_thresh = smile_thresh
         self.frown_thresh = frown_thresh
         self.corner_margin = corner_margin
+        self._mouth_h2 = 0.0
+
+    @property
+    def mouth_h(self) -> float:
+        """Inner-lip gap (pixels) of the last computed frame; only square-rooted when read."""
+        return math.sqrt(self._mouth_h2) + 1e-6
 
-    def compute(self, face_landmarks, img_w: int, img_h: int) -> Tuple[str, float, float, float]:
+    def compute(self, lm_arr: np.ndarray, img_w: int, img_h: int) -> Tuple[int, float, float]:
         """Compute label and diagnostics.
 
-        Returns: (label, mouth_w_norm, mouth_w, mouth_h)
-        label is one of 'smile', 'frown', 'neutral'
+        lm_arr: (N, 2) float32 array of normalized landmark (x, y), see `landmarks_to_array`
+        Returns: (label, mouth_w_norm, mouth_w); the mouth height is available as `mouth_h`
+        label is one of LABEL_SMILE, LABEL_FROWN, LABEL_NEUTRAL (see LABEL_TEXT)
         """
-        lms = face_landmarks.landmark
-
         # Convert to pixel coords
-        left_x, left_y = lms[L_IDX].x * img_w, lms[L_IDX].y * img_h
-        right_x, right_y = lms[R_IDX].x * img_w, lms[R_IDX].y * img_h
-        top_x, top_y = lms[U_IDX].x * img_w, lms[U_IDX].y * img_h
-        bottom_x, bottom_y = lms[B_IDX].x * img_w, lms[B_IDX].y * img_h
-
-        mouth_w = math.hypot(right_x - left_x, right_y - left_y)
-        mouth_h = math.hypot(bottom_x - top_x, bottom_y - top_y) + 1e-6
-        ratio = mouth_w / mouth_h
-
-        # face bbox for normalization
-        xs = [p.x * img_w for p in lms]
-        ys = [p.y * img_h for p in lms]
-        face_w = max(xs) - min(xs) + 1e-6
-        face_h = max(ys) - min(ys) + 1e-6
-
+        left_x, left_y = lm_arr[L_IDX, 0] * img_w, lm_arr[L_IDX, 1] * img_h
+        right_x, right_y = lm_arr[R_IDX, 0] * img_w, lm_arr[R_IDX, 1] * img_h
+        top_x, top_y = lm_arr[U_IDX, 0] * img_w, lm_arr[U_IDX, 1] * img_h
+        bottom_x, bottom_y = lm_arr[B_IDX, 0] * img_w, lm_arr[B_IDX, 1] * img_h
+
+        mouth_w2 = (right_x - left_x) ** 2 + (right_y - left_y) ** 2
+        # mouth height is a diagnostic only: keep it squared until someone reads mouth_h
+        self._mouth_h2 = (bottom_x - top_x) ** 2 + (bottom_y - top_y) ** 2
+
+        # face bbox for normalization: reduce in normalized space, scale the extents once
+        mins = lm_arr.min(0)
+        maxs = lm_arr.max(0)
+        face_w = float(maxs[0] - mins[0]) * img_w + 1e-6
+        face_h = float(maxs[1] - mins[1]) * img_h + 1e-6
+
+        # a single sqrt per frame; the thresholds apply to the smoothed (averaged) width,
+        # so the buffered value itself must stay linear
+        mouth_w = math.sqrt(mouth_w2)
         mouth_w_norm = mouth_w / face_w
 
         corners_mean_y = (left_y + right_y) / 2.0
@@ -164,35 +129,33 @@ class SmileDetector:
         corner_diff = corners_mean_y - mouth_center_y
         corner_diff_norm = corner_diff / face_h
 
-        # update buffers and compute averages
-        self.mouth_buf.append(mouth_w_norm)
-        self.corner_buf.append(corner_diff_norm)
-        avg_w = sum(self.mouth_buf) / len(self.mouth_buf)
-        avg_corner = sum(self.corner_buf) / len(self.corner_buf)
+        # update buffers and compute averages (slots not yet filled hold 0.0)
+        i = self._i
+        self._mouth_sum += mouth_w_norm - self.mouth_buf[i]
+        self._corner_sum += corner_diff_norm - self.corner_buf[i]
+        self.mouth_buf[i] = mouth_w_norm
+        self.corner_buf[i] = corner_diff_norm
+        self._i = (i + 1) % self.buf_size
+        self._n = min(self._n + 1, self.buf_size)
+        avg_w = self._mouth_sum / self._n
+        avg_corner = self._corner_sum / self._n
 
         # heuristics
         if avg_w >= self.smile_thresh and avg_corner < -self.corner_margin:
-            label = 'smile'
+            label = LABEL_SMILE
         elif avg_w <= self.frown_thresh and avg_corner > self.corner_margin:
-            label = 'frown'
+            label = LABEL_FROWN
         else:
-            label = 'neutral'
+            label = LABEL_NEUTRAL
 
-        return label, mouth_w_norm, mouth_w, mouth_h
-
-
-# ---------------------------------------------------------------------------
-# Visualization helper
-# ---------------------------------------------------------------------------
-def draw_label(frame, label: str, mouth_w_norm: float) -> None:
-    txt = f"{label} ({mouth_w_norm:.2f})"
-    cv2.putText(frame, txt, (30, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        return label, mouth_w_norm, mouth_w
 
 
 # ---------------------------------------------------------------------------
 # Main loop
 # ---------------------------------------------------------------------------
-def run(port: Optional[str], baud: int, smooth: int, noserial: bool, camera: int, verbose: bool):
+def run(port: Optional[str], baud: int, smooth: int, noserial: bool, camera: int, verbose: bool,
+        infer_fps: float = DEFAULT_INFER_FPS, infer_width: int = DEFAULT_INFER_WIDTH):
     logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format='[%(levelname)s] %(message)s')
 
     serial_client = None
@@ -207,53 +170,86 @@ def run(port: Optional[str], baud: int, smooth: int, noserial: bool, camera: int
     if not cap.isOpened():
         logging.error('Could not open camera index %s', camera)
         return
+    configure_capture(cap)
 
     detector = SmileDetector(buf_size=smooth)
+    label_overlay = TextOverlay("{} ({:.2f})", (30, 30), 0.8)
+    # FaceMesh dominates the frame cost; run it at most infer_fps times per second and
+    # keep drawing the last result on the frames in between (<= 0 means every frame)
+    infer_interval = 1.0 / infer_fps if infer_fps > 0 else 0.0
 
     mp_face_mesh = mp.solutions.face_mesh
-    with mp_face_mesh.FaceMesh(min_detection_confidence=0.7, min_tracking_confidence=0.7) as face_mesh:
+    # single face, no iris refinement: only the mouth and the face bbox are used
+    with mp_face_mesh.FaceMesh(max_num_faces=1, refine_landmarks=False,
+                               min_detection_confidence=0.7, min_tracking_confidence=0.7) as face_mesh:
         prev_label = None
+        lm_arr = None
+        label = None
+        mw_norm = 0.0
+        last_infer_t = float('-inf')
+        mirror_buf = None
+        small_buf = None
+        rgb_buf = None
+        rgb_ro = None
+        # start reading only once the models are loaded, so every exit path below
+        # stops the grabber before the capture is released
+        grabber = FrameGrabber(cap).start()
         try:
             while True:
-                ok, frame = cap.read()
+                # newest frame from the grabber thread; stale ones were already dropped
+                ok, frame = grabber.read()
                 if not ok:
                     logging.warning('Frame not read; exiting')
                     break
-                frame = cv2.flip(frame, 1)
+                # mirror, downscale and convert into buffers allocated once, instead of
+                # a fresh array per call
+                if mirror_buf is None or mirror_buf.shape != frame.shape:
+                    mirror_buf = np.empty_like(frame)
+                    infer_size = inference_size(frame.shape, infer_width)
+                    small_buf = np.empty((infer_size[1], infer_size[0], 3), dtype=np.uint8)
+                    rgb_buf = np.empty_like(small_buf)
+                    # read-only view handed to MediaPipe: it skips its defensive copy of
+                    # writeable inputs, while OpenCV keeps writing through rgb_buf
+                    rgb_ro = rgb_buf.view()
+                    rgb_ro.flags.writeable = False
+                frame = cv2.flip(frame, 1, dst=mirror_buf)
                 h, w = frame.shape[:2]
 
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = face_mesh.process(rgb)
-
-                label_text = ''
-                faces = getattr(results, 'multi_face_landmarks', None)
-                if faces:
-                    # process first face only
-                    face_landmarks = faces[0]
-
+                now = time.monotonic()
+                if now - last_infer_t >= infer_interval:
+                    last_infer_t = now
+                    # MediaPipe gets a small copy (landmarks are normalized, so they apply
+                    # to the full-size frame unchanged); the display keeps full resolution
+                    to_inference_rgb(frame, rgb_buf, small_buf)
+                    results = face_mesh.process(rgb_ro)
+
+                    label = None
+                    faces = getattr(results, 'multi_face_landmarks', None)
+                    if faces:
+                        # process first face only
+                        lm_arr = landmarks_to_array(faces[0])
+                        label, mw_norm, mw = detector.compute(lm_arr, w, h)
+
+                        # send over serial if available and changed
+                        if serial_client and label != prev_label:
+                            sent = serial_client.send_signal(label)
+                            if sent:
+                                prev_label = label
+
+                # overlay and show (reuses the last inference result between inferences)
+                if label is not None:
                     # draw mouth corner markers
-                    left_m = face_landmarks.landmark[L_IDX]
-                    right_m = face_landmarks.landmark[R_IDX]
-                    cv2.circle(frame, (int(left_m.x * w), int(left_m.y * h)), 5, (255, 0, 0), -1)
-                    cv2.circle(frame, (int(right_m.x * w), int(right_m.y * h)), 5, (255, 0, 0), -1)
-
-                    label, mw_norm, mw, mh = detector.compute(face_landmarks, w, h)
-                    label_text = f"{label} ({mw_norm:.2f})"
-
-                    # send over serial if available and changed
-                    if serial_client and label != prev_label:
-                        sent = serial_client.send_signal(label)
-                        if sent:
-                            prev_label = label
-
-                # overlay and show
-                if label_text:
-                    draw_label(frame, label, mw_norm)
+                    left_m, right_m = (lm_arr[[L_IDX, R_IDX]] * (w, h)).astype(int)
+                    cv2.circle(frame, (int(left_m[0]), int(left_m[1])), 5, (255, 0, 0), -1)
+                    cv2.circle(frame, (int(right_m[0]), int(right_m[1])), 5, (255, 0, 0), -1)
+                    # round first so the cached text is reused while the value jitters
+                    label_overlay.draw(frame, LABEL_TEXT[label], round(float(mw_norm), 2))
                 cv2.imshow('Webcam Feed', frame)
 
                 if cv2.waitKey(1) & 0xFF == ord('q'):
                     break
         finally:
+            grabber.stop()
             try:
                 cap.release()
             except Exception:
@@ -271,13 +267,19 @@ def parse_args():
     p = argparse.ArgumentParser(description='Face expression -> Arduino (smile/neutral/frown)')
     p.add_argument('--port', type=str, default=DEFAULT_PORT, help='Serial port (e.g. /dev/ttyACM0)')
     p.add_argument('--baud', type=int, default=DEFAULT_BAUD, help='Serial baud rate')
-    p.add_argument('--smooth', type=int, default=DEFAULT_SMOOTH, help='Number of frames to smooth over')
+    p.add_argument('--smooth', type=int, default=DEFAULT_SMOOTH,
+                   help='Number of inferences to smooth over (see --infer-fps)')
     p.add_argument('--noserial', action='store_true', help='Do not open serial port (visual only)')
     p.add_argument('--camera', type=int, default=DEFAULT_CAMERA, help='Camera device index')
+    p.add_argument('--infer-fps', type=float, default=DEFAULT_INFER_FPS,
+                   help='Max FaceMesh inferences per second (0 = every frame)')
+    p.add_argument('--infer-width', type=int, default=DEFAULT_INFER_WIDTH,
+                   help='Width frames are downscaled to for MediaPipe (0 = full resolution)')
     p.add_argument('--verbose', action='store_true', help='Enable debug logging')
     return p.parse_args()
 
 
 if __name__ == '__main__':
     args = parse_args()
-    run(args.port, args.baud, args.smooth, args.noserial, args.camera, args.verbose)
+    run(args.port, args.baud, args.smooth, args.noserial, args.camera, args.verbose, args.infer_fps,
+        args.infer_width)
@@ -2,171 +2,128 @@ import argparse
 import logging
 import time
 from collections import deque
-from typing import Optional
+from typing import Optional, Tuple
 
 import cv2
 import mediapipe as mp
+import numpy as np
+
+from cv_common import (DEFAULT_BAUD, FrameGrabber, SerialClient as BaseSerialClient, TextOverlay,
+                       configure_capture, inference_size, landmarks_to_array, serial, to_inference_rgb)
 
 try:
-    import serial
-    import serial.tools.list_ports
-    from serial.serialutil import SerialException
+    from numba import njit
 except Exception:
-    serial = None
+    njit = None
 
 
 # ---------------------------------------------------------------------------
 # Configuration / Defaults
 # ---------------------------------------------------------------------------
 DEFAULT_PORT = "/dev/ttyACM0"
-DEFAULT_BAUD = 9600
 DEFAULT_SMOOTH = 5
 DEFAULT_CAMERA = 0
+DEFAULT_INFER_FPS = 15.0
+DEFAULT_INFER_WIDTH = 320
 
 # Mediapipe landmark ids
 FINGER_TIP_IDS = [4, 8, 12, 16, 20]
 
+# pre-encoded serial lines for every possible count, so sending does no formatting
+_COUNT_TO_BYTES = tuple(f"{n}\n".encode() for n in range(len(FINGER_TIP_IDS) + 1))
+TIP_IDX = np.array([8, 12, 16, 20], dtype=np.int32)  # non-thumb finger tips
+PIP_IDX = np.array([6, 10, 14, 18], dtype=np.int32)  # matching PIP joints
+# (E, 2) landmark index pairs of the hand skeleton edges
+HAND_CONNECTIONS = np.asarray(sorted(mp.solutions.hands.HAND_CONNECTIONS), dtype=np.int32)
+
 
 # ---------------------------------------------------------------------------
 # Serial helper
 # ---------------------------------------------------------------------------
-class SerialClient:
-    """Simple serial wrapper that tries to open a port and provides a send() method.
-
-    If pyserial is not installed or the port cannot be opened, the client becomes a
-    no-op (useful for running without hardware).
-    """
-
-    def __init__(self, port: Optional[str], baud: int = DEFAULT_BAUD, retries: int = 3, delay: float = 1.0):
-        self.port = port
-        self.baud = baud
-        self.retries = retries
-        self.delay = delay
-        self._ser = None
-        self._available = False
-        if port and serial:
-            self.open()
-        else:
-            logging.info("Serial not available or port not provided; running in noserial mode")
-
-    def open(self) -> None:
-        candidates = [self.port] if self.port else [p.device for p in serial.tools.list_ports.comports() if ('ACM' in p.device or 'USB' in p.device)]
-        for p in candidates:
-            for attempt in range(1, self.retries + 1):
-                try:
-                    self._ser = serial.Serial(p, self.baud, timeout=1)
-                    time.sleep(0.1)  # give device a moment
-                    self._available = True
-                    logging.info("Opened serial port %s at %d", p, self.baud)
-                    return
-                except SerialException as e:
-                    logging.debug("Attempt %d: could not open %s: %s", attempt, p, e)
-                    time.sleep(self.delay)
-        logging.warning("Failed to open any serial port; continuing without serial output")
+class SerialClient(BaseSerialClient):
+    """Serial client (see cv_common.SerialClient) that sends finger counts."""
 
     def send_count(self, n: int) -> bool:
-        """Send an integer count followed by newline. Returns True if send succeeded."""
-        if not self._available or not self._ser:
-            return False
-        try:
-            msg = f"{int(n)}\n"
-            self._ser.write(msg.encode())
-            logging.debug("Sent to serial: %s", msg.strip())
-            return True
-        except Exception as e:
-            logging.warning("Serial write failed: %s", e)
-            try:
-                self._ser.close()
-            except Exception:
-                pass
-            self._available = False
-            self._ser = None
-            return False
-
-    def close(self) -> None:
-        if self._ser:
-            try:
-                self._ser.close()
-            except Exception:
-                pass
-            self._ser = None
-            self._available = False
+        """Queue an integer count followed by newline for the serial writer (never blocks).
+
+        Returns True if the message was queued.
+        """
+        n = int(n)
+        return self.send(_COUNT_TO_BYTES[n] if 0 <= n < len(_COUNT_TO_BYTES) else f"{n}\n".encode())
 
 
 # ---------------------------------------------------------------------------
 # Hand counting logic
 # ---------------------------------------------------------------------------
+def _count(lm_xy, flipped, is_right):
+    """Count extended fingers on a (21, 2) landmark array (see HandCounter.count)."""
+    # Other fingers: finger tip is above pip (y smaller) when extended; one vector compare
+    fingers = np.sum(lm_xy[TIP_IDX, 1] < lm_xy[PIP_IDX, 1])
+
+    # Thumb heuristic: compare x of tip (4) and ip (3). Behavior depends on mirroring.
+    # When image is flipped (mirror), x-axis is mirrored relative to camera coords:
+    # a right hand in a mirrored image has thumb tip.x < ip.x when open, and each of
+    # "not mirrored" / "left hand" inverts the comparison.
+    thumb_open = (lm_xy[4, 0] < lm_xy[3, 0]) ^ (is_right != flipped)
+
+    return fingers + thumb_open
+
+
+if njit is not None:
+    # compiled to machine code on first call (cached on disk); pure Python otherwise
+    _count = njit(cache=True)(_count)
+
+
 class HandCounter:
 
     def __init__(self, assume_right_hand: bool = True, flipped: bool = True):
         self.assume_right_hand = assume_right_hand
         self.flipped = flipped
 
-    def count(self, hand_landmarks,
+    def warmup(self) -> None:
+        """Trigger JIT compilation of the counting kernel before the camera loop starts."""
+        _count(np.zeros((21, 2), dtype=np.float32), self.flipped, self.assume_right_hand)
+
+    def count(self, lm_xy: np.ndarray,
               handedness_label: Optional[str] = None) -> int:
         """Return number of fingers extended (0..5).
 
-        hand_landmarks: a mediapipe landmarks object for one hand
+        lm_xy: (21, 2) float32 array of normalized landmark (x, y), see `landmarks_to_array`
         handedness_label: optional string 'Right'/'Left' reported by MediaPipe
         """
-        lm = hand_landmarks.landmark
-        fingers = 0
-
         # determine hand label
         if handedness_label:
-            hand_label = handedness_label
+            is_right = handedness_label == 'Right'
         else:
-            hand_label = 'Right' if self.assume_right_hand else 'Left'
-
-        # Thumb heuristic: compare x of tip and ip. Behavior depends on mirroring.
-        thumb_tip = lm[4]
-        thumb_ip = lm[3]
-        # When image is flipped (mirror), x-axis is mirrored relative to camera coords.
-        if hand_label == 'Right':
-            if self.flipped:
-                # right hand in mirrored image: thumb tip.x < ip.x when open
-                if thumb_tip.x < thumb_ip.x:
-                    fingers += 1
-            else:
-                if thumb_tip.x > thumb_ip.x:
-                    fingers += 1
-        else:  # Left hand
-            if self.flipped:
-                if thumb_tip.x > thumb_ip.x:
-                    fingers += 1
-            else:
-                if thumb_tip.x < thumb_ip.x:
-                    fingers += 1
-
-        # Other fingers: finger tip is above pip (y smaller) when extended
-        for tip_id in [8, 12, 16, 20]:
-            tip = lm[tip_id]
-            pip = lm[tip_id - 2]
-            if tip.y < pip.y:
-                fingers += 1
-
-        # clamp to valid range
-        if fingers < 0:
-            fingers = 0
-        if fingers > 5:
-            fingers = 5
-        return fingers
+            is_right = self.assume_right_hand
+        return int(_count(lm_xy, self.flipped, is_right))
 
 
 # ---------------------------------------------------------------------------
 # Visualization helpers
 # ---------------------------------------------------------------------------
 
-def draw_overlay(frame, count: int, avg: int) -> None:
-    text = f"Count: {avg}"
-    cv2.putText(frame, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
+def draw_hand(frame, lm_xy: np.ndarray,
+              line_color: Tuple[int, int, int] = (224, 224, 224),
+              point_color: Tuple[int, int, int] = (0, 0, 255)) -> None:
+    """Draw the hand skeleton from a (21, 2) normalized landmark array.
+
+    Replaces mediapipe's draw_landmarks: landmarks are scaled to pixels in one
+    vectorized step and all edges go to OpenCV in a single polylines call.
+    """
+    h, w = frame.shape[:2]
+    pts = (lm_xy * (w, h)).astype(np.int32)
+    cv2.polylines(frame, pts[HAND_CONNECTIONS], False, line_color, 2)
+    for x, y in pts.tolist():
+        cv2.circle(frame, (x, y), 2, point_color, -1)
 
 
 # ---------------------------------------------------------------------------
 # Main loop
 # ---------------------------------------------------------------------------
 
-def run_camera_loop(port: Optional[str], baud: int, smooth_frames: int, noserial: bool, camera_index: int):
+def run_camera_loop(port: Optional[str], baud: int, smooth_frames: int, noserial: bool, camera_index: int,
+                    infer_fps: float = DEFAULT_INFER_FPS, infer_width: int = DEFAULT_INFER_WIDTH):
     # initialize serial client if requested
     serial_client = None
     if not noserial and serial:
@@ -175,57 +132,104 @@ def run_camera_loop(port: Optional[str], baud: int, smooth_frames: int, noserial
         logging.warning("pyserial not installed; running in noserial mode")
         noserial = True
 
+    # JIT-compile the counting kernel before the camera opens, so the compile time is
+    # not spent with the device already streaming
+    hand_counter = HandCounter(assume_right_hand=True, flipped=True)
+    hand_counter.warmup()
+
     # setup video capture
     cap = cv2.VideoCapture(camera_index)
     if not cap.isOpened():
         logging.error("Could not open camera index %s", camera_index)
         return
+    configure_capture(cap)
 
-    hand_counter = HandCounter(assume_right_hand=True, flipped=True)
+    count_overlay = TextOverlay("Count: {}", (10, 30), 1.0)
     buffer = deque(maxlen=max(1, smooth_frames))
     prev_sent = None
+    # Hands inference dominates the frame cost; run it at most infer_fps times per second
+    # and keep drawing the last result on the frames in between (<= 0 means every frame)
+    infer_interval = 1.0 / infer_fps if infer_fps > 0 else 0.0
+    last_infer_t = float('-inf')
+    mirror_buf = None
+    small_buf = None
+    rgb_buf = None
+    rgb_ro = None
+    hand_found = False
+    lm_xy = None
+    detected_count = 0
+    avg = 0
 
     mp_hands = mp.solutions.hands
-    with mp_hands.Hands(min_detection_confidence=0.6, min_tracking_confidence=0.6) as hands:
+    # lite model, single hand: tip/PIP comparisons do not need the full model, and
+    # only the first hand is ever counted
+    with mp_hands.Hands(model_complexity=0, max_num_hands=1,
+                        min_detection_confidence=0.6, min_tracking_confidence=0.6) as hands:
+        # start reading only once the models are loaded, so every exit path below
+        # stops the grabber before the capture is released
+        grabber = FrameGrabber(cap).start()
         try:
             while True:
-                ok, frame = cap.read()
+                # newest frame from the grabber thread; stale ones were already dropped
+                ok, frame = grabber.read()
                 if not ok:
                     logging.warning("Frame not read from camera; exiting")
                     break
-                frame = cv2.flip(frame, 1)
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = hands.process(rgb)
-
-                detected_count = 0
-                handedness_label = None
-                if getattr(results, 'multi_hand_landmarks', None):
-                    hand_landmarks = results.multi_hand_landmarks[0]
-                    try:
-                        handedness_label = results.multi_handedness[0].classification[0].label
-                    except Exception:
-                        handedness_label = None
-
-                    detected_count = hand_counter.count(hand_landmarks, handedness_label)
-                    mp.solutions.drawing_utils.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
-
-                buffer.append(detected_count)
-                avg = int(round(sum(buffer) / len(buffer)))
-
-                # overlay
-                draw_overlay(frame, detected_count, avg)
+                # mirror, downscale and convert into buffers allocated once, instead of
+                # a fresh array per call
+                if mirror_buf is None or mirror_buf.shape != frame.shape:
+                    mirror_buf = np.empty_like(frame)
+                    infer_size = inference_size(frame.shape, infer_width)
+                    small_buf = np.empty((infer_size[1], infer_size[0], 3), dtype=np.uint8)
+                    rgb_buf = np.empty_like(small_buf)
+                    # read-only view handed to MediaPipe: it skips its defensive copy of
+                    # writeable inputs, while OpenCV keeps writing through rgb_buf
+                    rgb_ro = rgb_buf.view()
+                    rgb_ro.flags.writeable = False
+                frame = cv2.flip(frame, 1, dst=mirror_buf)
+
+                now = time.monotonic()
+                if now - last_infer_t >= infer_interval:
+                    last_infer_t = now
+                    # MediaPipe gets a small copy (landmarks are normalized, so they apply
+                    # to the full-size frame unchanged); the display keeps full resolution
+                    to_inference_rgb(frame, rgb_buf, small_buf)
+                    results = hands.process(rgb_ro)
+
+                    detected_count = 0
+                    hand_found = False
+                    handedness_label = None
+                    if getattr(results, 'multi_hand_landmarks', None):
+                        hand_landmarks = results.multi_hand_landmarks[0]
+                        try:
+                            handedness_label = results.multi_handedness[0].classification[0].label
+                        except Exception:
+                            handedness_label = None
+
+                        lm_xy = landmarks_to_array(hand_landmarks)
+                        hand_found = True
+                        detected_count = hand_counter.count(lm_xy, handedness_label)
+
+                    buffer.append(detected_count)
+                    avg = int(round(sum(buffer) / len(buffer)))
+
+                    # send to serial if changed
+                    if serial_client and avg != prev_sent:
+                        sent = serial_client.send_count(avg)
+                        if sent:
+                            prev_sent = avg
+
+                # overlay (reuses the last inference result between inferences)
+                if hand_found:
+                    draw_hand(frame, lm_xy)
+                count_overlay.draw(frame, avg)
                 cv2.imshow('Fingers', frame)
 
-                # send to serial if changed
-                if serial_client and avg != prev_sent:
-                    sent = serial_client.send_count(avg)
-                    if sent:
-                        prev_sent = avg
-
                 key = cv2.waitKey(1) & 0xFF
                 if key == ord('q'):
                     break
         finally:
+            grabber.stop()
             cap.release()
             cv2.destroyAllWindows()
             if serial_client:
@@ -240,9 +244,14 @@ def parse_args():
     p = argparse.ArgumentParser(description='Finger counting with MediaPipe and optional Arduino output')
     p.add_argument('--port', type=str, default=DEFAULT_PORT, help='Serial port (e.g. /dev/ttyACM0)')
     p.add_argument('--baud', type=int, default=DEFAULT_BAUD, help='Serial baud rate')
-    p.add_argument('--smooth', type=int, default=DEFAULT_SMOOTH, help='Number of frames to smooth over')
+    p.add_argument('--smooth', type=int, default=DEFAULT_SMOOTH,
+                   help='Number of inferences to smooth over (see --infer-fps)')
     p.add_argument('--noserial', action='store_true', help='Do not open serial port (visual only)')
     p.add_argument('--camera', type=int, default=DEFAULT_CAMERA, help='Camera device index')
+    p.add_argument('--infer-fps', type=float, default=DEFAULT_INFER_FPS,
+                   help='Max MediaPipe Hands inferences per second (0 = every frame)')
+    p.add_argument('--infer-width', type=int, default=DEFAULT_INFER_WIDTH,
+                   help='Width frames are downscaled to for MediaPipe (0 = full resolution)')
     p.add_argument('--verbose', action='store_true', help='Enable debug logging')
     return p.parse_args()
 
@@ -251,7 +260,8 @@ def main():
     args = parse_args()
     logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='[%(levelname)s] %(message)s')
     logging.info('Starting finger-counting (noserial=%s) ...', args.noserial)
-    run_camera_loop(args.port, args.baud, args.smooth, args.noserial, args.camera)
+    run_camera_loop(args.port, args.baud, args.smooth, args.noserial, args.camera, args.infer_fps,
+                    args.infer_width)
 
 
 if __name__ == '__main__':
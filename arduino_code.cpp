@@ -11,7 +11,7 @@ void setup() {
     digitalWrite(LED_PINS[i], LOW);
   }
 
-  Serial.begin(9600);
+  Serial.begin(115200);  // must match DEFAULT_BAUD in cv_common.py
   // For native-USB boards wait for serial to be ready
   #if defined(USBCON) || defined(ARDUINO_ARCH_SAM) || defined(ARDUINO_ARCH_SAMD)
     while (!Serial) {
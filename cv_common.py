@@ -0,0 +1,349 @@
+"""Helpers shared by FacialExpression.py and _5Fingers.py: serial output, camera
+capture, landmark conversion and the text overlay.
+
+Lives next to the scripts, so `python FacialExpression.py` / `python _5Fingers.py`
+import it from the repository directory without any install step.
+"""
+import functools
+import logging
+import queue
+import threading
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    import serial
+    import serial.tools.list_ports
+    from serial.serialutil import SerialException
+except Exception:
+    serial = None
+
+
+# ---------------------------------------------------------------------------
+# Defaults
+# ---------------------------------------------------------------------------
+DEFAULT_BAUD = 115200  # must match Serial.begin() in arduino_code.cpp
+
+# Capture settings
+CAPTURE_WIDTH = 640
+CAPTURE_HEIGHT = 480
+
+
+# ---------------------------------------------------------------------------
+# Serial helper
+# ---------------------------------------------------------------------------
+@functools.lru_cache(maxsize=1)
+def _list_candidates() -> Tuple[str, ...]:
+    """Serial devices that look like an Arduino (ttyACM* / ttyUSB*).
+
+    Enumerating ports walks /dev (or queries WMI on Windows), so the scan runs once
+    per process; call `_list_candidates.cache_clear()` to force a rescan.
+    """
+    return tuple(p.device for p in serial.tools.list_ports.comports() if ('ACM' in p.device or 'USB' in p.device))
+
+
+class SerialClient:
+    """Simple serial wrapper that tries to open a port and provides a send() method.
+
+    If pyserial is not installed or the port cannot be opened, the client becomes a
+    no-op (useful for running without hardware). The scripts subclass it to add
+    their own message encoding (send_signal / send_count).
+    """
+
+    def __init__(self, port: Optional[str], baud: int = DEFAULT_BAUD, retries: int = 3, delay: float = 1.0):
+        self.port = port
+        self.baud = baud
+        self.retries = retries
+        self.delay = delay
+        self._ser = None
+        self._available = False
+        # writes happen on a background thread so a stalled USB write never blocks the
+        # vision loop; _lock serializes them against close()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=1)
+        self._writer = None
+        if port and serial:
+            self.open()
+        else:
+            logging.info("Serial not available or port not provided; running in noserial mode")
+
+    def open(self) -> None:
+        candidates = [self.port] if self.port else _list_candidates()
+        for p in candidates:
+            for attempt in range(1, self.retries + 1):
+                try:
+                    # write_timeout: a device that stops reading makes write() raise
+                    # instead of blocking the writer (and close()) forever
+                    self._ser = serial.Serial(p, self.baud, timeout=1, write_timeout=1)
+                    time.sleep(0.1)  # give device a moment
+                    self._available = True
+                    logging.info("Opened serial port %s at %d", p, self.baud)
+                    self._start_writer()
+                    return
+                except SerialException as e:
+                    logging.debug("Attempt %d: could not open %s: %s", attempt, p, e)
+                    time.sleep(self.delay)
+        logging.warning("Failed to open any serial port; continuing without serial output")
+
+    def send(self, msg: bytes) -> bool:
+        """Queue one pre-encoded line for the serial writer (never blocks).
+
+        Returns True if the message was queued.
+        """
+        if not self._available or not self._ser:
+            return False
+        self._enqueue(msg)
+        return True
+
+    def close(self) -> None:
+        if self._writer is not None:
+            # blocking put: lets the writer finish the pending message before it stops
+            try:
+                self._queue.put(None, timeout=1.0)
+            except queue.Full:
+                pass
+            self._writer.join(timeout=1.0)
+            self._writer = None
+        # bounded wait: if the writer is still stuck inside write(), close the port
+        # anyway, which makes that write fail instead of hanging the shutdown
+        locked = self._lock.acquire(timeout=1.0)
+        if not locked:
+            logging.warning("Serial writer still busy; closing the port anyway")
+        try:
+            if self._ser:
+                try:
+                    self._ser.close()
+                except Exception:
+                    pass
+                self._ser = None
+                self._available = False
+        finally:
+            if locked:
+                self._lock.release()
+
+    def _start_writer(self) -> None:
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._writer_loop, name='serial-writer', daemon=True)
+            self._writer.start()
+
+    def _enqueue(self, msg: bytes) -> None:
+        """Hand `msg` to the writer thread without blocking.
+
+        The queue holds a single message: a pending one that the writer has not
+        picked up yet is stale and gets replaced by the newer value.
+        """
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self._queue.put_nowait(msg)
+        except queue.Full:
+            pass
+
+    def _writer_loop(self) -> None:
+        while True:
+            msg = self._queue.get()
+            if msg is None:
+                return
+            with self._lock:
+                if not self._available or not self._ser:
+                    continue
+                try:
+                    # no flush(): the write already goes straight to the device, and
+                    # flush() would block in tcdrain until the UART has emptied
+                    self._ser.write(msg)
+                    if logging.getLogger().isEnabledFor(logging.DEBUG):
+                        logging.debug("Sent to serial: %s", msg.strip().decode())
+                except Exception as e:
+                    logging.warning("Serial write failed: %s", e)
+                    try:
+                        self._ser.close()
+                    except Exception:
+                        pass
+                    self._available = False
+                    self._ser = None
+
+
+# ---------------------------------------------------------------------------
+# Capture helpers
+# ---------------------------------------------------------------------------
+def configure_capture(cap, width: int = CAPTURE_WIDTH, height: int = CAPTURE_HEIGHT) -> None:
+    """Ask the camera for MJPEG at a modest resolution.
+
+    MediaPipe downsamples internally, so larger frames only add decode cost. Drivers
+    that do not support a property silently ignore it.
+    """
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+
+def inference_size(frame_shape, width: int) -> Tuple[int, int]:
+    """Return the (w, h) MediaPipe input size for frames of `frame_shape`.
+
+    Keeps the aspect ratio so normalized landmarks map straight back onto the
+    full-size display frame. `width` <= 0 (or >= the frame width) means no downscale.
+    """
+    fh, fw = frame_shape[:2]
+    if width <= 0 or width >= fw:
+        return fw, fh
+    return width, max(1, round(fh * width / fw))
+
+
+def to_inference_rgb(frame, rgb_buf: np.ndarray, small_buf: np.ndarray) -> np.ndarray:
+    """Downscale the BGR `frame` to `rgb_buf`'s size and convert it to RGB into `rgb_buf`.
+
+    Resizing first means the full-size frame is read exactly once; the channel swap
+    then only touches the small image. Both steps write into preallocated buffers.
+    """
+    if rgb_buf.shape == frame.shape:
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_buf)
+    else:
+        cv2.resize(frame, (rgb_buf.shape[1], rgb_buf.shape[0]), dst=small_buf, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(small_buf, cv2.COLOR_BGR2RGB, dst=rgb_buf)
+    return rgb_buf
+
+
+class FrameGrabber:
+    """Reads camera frames on a background thread so the main loop never waits on I/O.
+
+    The thread keeps grab()/retrieve()-ing as fast as the camera delivers, which also
+    keeps the driver queue drained. Only the newest decoded frame is kept: frames the
+    main loop did not get to are dropped, so read() always returns the latest one.
+    """
+
+    def __init__(self, cap):
+        self._cap = cap
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0      # number of frames decoded so far
+        self._taken = 0    # seq of the last frame returned by read()
+        self._ok = True
+        self._running = False
+        self._thread = None
+
+    def start(self) -> 'FrameGrabber':
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name='frame-grabber', daemon=True)
+        self._thread.start()
+        return self
+
+    def _loop(self) -> None:
+        while self._running:
+            ok = self._cap.grab()
+            frame = self._cap.retrieve()[1] if ok else None
+            with self._cond:
+                if frame is not None:
+                    # swap the reference only; the previous frame stays valid for
+                    # whoever is still holding it
+                    self._frame = frame
+                    self._seq += 1
+                else:
+                    self._ok = False
+                self._cond.notify_all()
+            if frame is None:
+                return
+
+    def read(self):
+        """Return (ok, frame) with the newest frame not returned before.
+
+        Blocks until one arrives, like cap.read(); (False, None) only once the grabber
+        thread has failed to read from the camera.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != self._taken or not self._ok)
+            if self._seq == self._taken:
+                return False, None
+            self._taken = self._seq
+            return True, self._frame
+
+    def stop(self) -> None:
+        """Stop the grabber thread and wait for it to exit.
+
+        The join is unbounded on purpose: the thread may be inside cap.grab(), and
+        the capture must not be released until it has returned.
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# ---------------------------------------------------------------------------
+# Landmark helpers
+# ---------------------------------------------------------------------------
+def landmarks_to_array(landmarks) -> np.ndarray:
+    """Materialize a mediapipe landmark list as an (N, 2) float32 array of normalized (x, y).
+
+    The protobuf is traversed exactly once, straight into the result array.
+    """
+    lms = landmarks.landmark
+    n = len(lms)
+    return np.fromiter((v for p in lms for v in (p.x, p.y)), dtype=np.float32, count=n * 2).reshape(n, 2)
+
+
+# ---------------------------------------------------------------------------
+# Visualization helper
+# ---------------------------------------------------------------------------
+class TextOverlay:
+    """Draws one line of text at a fixed position, rasterizing it only when it changes.
+
+    The text is rendered once into a small coverage mask; every frame blends the
+    colour into the frame ROI through that mask instead of re-drawing the Hershey
+    glyphs. putText anti-aliases the glyph edges (OpenCV 5 does so even for LINE_8),
+    so the mask holds partial coverage and the blend reproduces putText's
+    `(dst * (255 - a) + color * a + 127) // 255` exactly, in integer arithmetic.
+    `fmt` is a str.format template filled from the values passed to draw().
+    """
+
+    def __init__(self, fmt: str, org: Tuple[int, int], scale: float,
+                 color: Tuple[int, int, int] = (0, 255, 0), thickness: int = 2,
+                 font: int = cv2.FONT_HERSHEY_SIMPLEX):
+        self.fmt = fmt
+        self.org = org
+        self.scale = scale
+        self.color = color
+        self.thickness = thickness
+        self.font = font
+        self._values = None
+        self._inv_alpha = None  # 255 - coverage, uint16 (h, w, 3)
+        self._premult = None    # color * coverage, uint16 (h, w, 3)
+        self._acc = None        # per-frame scratch, uint16 (h, w, 3)
+        self._top_left = (0, 0)
+
+    def _render(self, text: str) -> None:
+        (tw, th), baseline = cv2.getTextSize(text, self.font, self.scale, self.thickness)
+        pad = self.thickness
+        h, w = th + baseline + 2 * pad, tw + 2 * pad
+        origin = (pad, pad + th)
+        mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.putText(mask, text, origin, self.font, self.scale, 255, self.thickness)
+        alpha = mask.astype(np.uint16)[:, :, None]
+        self._inv_alpha = np.repeat(255 - alpha, 3, axis=2)
+        self._premult = alpha * np.asarray(self.color, dtype=np.uint16)
+        self._acc = np.empty((h, w, 3), dtype=np.uint16)
+        self._top_left = (self.org[0] - pad, self.org[1] - th - pad)
+
+    def draw(self, frame, *values) -> None:
+        if values != self._values:
+            self._render(self.fmt.format(*values))
+            self._values = values
+        x0, y0 = self._top_left
+        h, w = self._acc.shape[:2]
+        # clip to the frame (the text may sit partly outside on tiny frames)
+        fx0, fy0 = max(x0, 0), max(y0, 0)
+        fx1, fy1 = min(x0 + w, frame.shape[1]), min(y0 + h, frame.shape[0])
+        if fx1 <= fx0 or fy1 <= fy0:
+            return
+        py, px = fy0 - y0, fx0 - x0
+        src = (slice(py, py + fy1 - fy0), slice(px, px + fx1 - fx0))
+        roi = frame[fy0:fy1, fx0:fx1]
+        acc = self._acc[src]
+        np.multiply(roi, self._inv_alpha[src], out=acc)
+        np.add(acc, self._premult[src], out=acc)
+        # acc / 255 rounded to nearest, written straight back into the ROI
+        cv2.convertScaleAbs(acc, roi, 1.0 / 255)
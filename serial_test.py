@@ -1,4 +1,6 @@
 import argparse
+import os
+import select
 import sys
 import time
 import serial
@@ -15,7 +17,7 @@ def list_ports():
         print(f"{p.device}\t{p.description}")
 
 
-def open_port(port, baud=9600, retries=3, delay=1.0, timeout=1.0):
+def open_port(port, baud=115200, retries=3, delay=1.0, timeout=1.0):
     """Attempt to open `port` with retries. Returns a serial.Serial or None."""
     for attempt in range(1, retries + 1):
         try:
@@ -31,6 +33,24 @@ def open_port(port, baud=9600, retries=3, delay=1.0, timeout=1.0):
     return None
 
 
+def read_chunk(ser, timeout):
+    """Read whatever arrives on `ser` within `timeout` seconds (b"" if nothing did).
+
+    On POSIX this blocks in select() until the port is readable, so waiting costs no
+    CPU and the first byte is picked up immediately. select() does not work on serial
+    handles on Windows, which keeps the old read-then-sleep polling.
+    """
+    if os.name != 'nt' and hasattr(ser, 'fileno'):
+        rlist, _, _ = select.select([ser.fileno()], [], [], max(0.0, timeout))
+        if not rlist:
+            return b""
+        return ser.read(ser.in_waiting or 1)
+    chunk = ser.read(ser.in_waiting or 1)
+    if not chunk:
+        time.sleep(0.01)
+    return chunk
+
+
 def send_and_read_once(ser, msg, read_timeout=1.0):
     try:
         ser.reset_input_buffer()
@@ -49,14 +69,12 @@ def send_and_read_once(ser, msg, read_timeout=1.0):
     buf = b""
     while time.time() - t0 < read_timeout:
         try:
-            chunk = ser.read(ser.in_waiting or 1)
+            chunk = read_chunk(ser, read_timeout - (time.time() - t0))
         except Exception as e:
             print(f"Read error: {e}")
             break
         if chunk:
             buf += chunk
-        else:
-            time.sleep(0.01)
     if buf:
         try:
             print("Received:", buf.decode(errors='replace'))
@@ -72,15 +90,13 @@ def echo_mode(ser, duration=5):
     try:
         while time.time() - t0 < duration:
             try:
-                chunk = ser.read(ser.in_waiting or 1)
+                chunk = read_chunk(ser, duration - (time.time() - t0))
             except Exception as e:
                 print(f"Read error: {e}")
                 break
             if chunk:
                 sys.stdout.write(chunk.decode(errors='replace'))
                 sys.stdout.flush()
-            else:
-                time.sleep(0.01)
     except KeyboardInterrupt:
         print('\nStopped by user')
 
@@ -104,7 +120,7 @@ def main():
     p = argparse.ArgumentParser(description='Serial port test utility')
     p.add_argument('--list', action='store_true', help='List available serial ports')
     p.add_argument('--port', type=str, help='Serial device path to open (e.g., /dev/ttyACM0)')
-    p.add_argument('--baud', type=int, default=9600, help='Baud rate')
+    p.add_argument('--baud', type=int, default=115200, help='Baud rate')
     p.add_argument('--send', type=str, help='Send this message and exit')
     p.add_argument('--echo', type=float, help='Read/echo for N seconds and exit')
     p.add_argument('--interactive', action='store_true', help='Open port and interactively send lines')